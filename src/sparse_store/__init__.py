@@ -3,7 +3,14 @@ __version__ = "0.1.0"
 from .config import Config
 from .config import dump_yaml
 from .config import load_yaml
+from .daemon import Daemon
+from .daemon import send_request
+from .delta import delta_copy
+from .metadata import MetadataTable
 from .main import InitCommand
 from .main import main
 from .path import storage_path
+from .profiling import Profiler
+from .profiling import PrometheusTextfileHook
+from .store import BackupResult
 from .store import Store
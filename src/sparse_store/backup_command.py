@@ -2,6 +2,8 @@ import pathlib
 
 from cleo import Command
 
+from .config import FormatException
+from .profiling import build_profiler
 from .store import Store
 from .verbosity import Verbosity
 
@@ -13,14 +15,20 @@ class BackupCommand(Command):
     backup
         {path : path to create for sparse_store and configuration}
         {--dry-run : If set, just show what would have been done}
+        {--profile : If set, show per-stage timings and counters after the backup}
+        {--profile-output= : If set, write cProfile stats to this file}
+        {--profile-textfile= : If set, write metrics to this Prometheus textfile for node_exporter}
     """
 
     def handle(self):
         path = pathlib.Path(self.argument("path"))
         dry_run = self.option("dry-run")
         perform = not dry_run
+        profiler = build_profiler(
+            self.option("profile-textfile"), self.option("profile-output")
+        )
 
-        store = Store(path, io=self.io, perform=perform)
+        store = Store(path, io=self.io, perform=perform, profiler=profiler)
         self.line("", style="", verbosity=Verbosity.VERBOSE)
         self.line(f'Store: "{store.project_path}"', verbosity=Verbosity.NORMAL)
         if dry_run:
@@ -29,7 +37,19 @@ class BackupCommand(Command):
             )
         self.line(f"Commencing backup...")
         if perform:
-            failures = store.backup()
+            profiler.start()
+            try:
+                failures = store.backup().failures
+            except FormatException as exception:
+                got = f" (got {exception})" if str(exception) else ""
+                self.line(
+                    f'Invalid "{store.config_file()}": {exception.__doc__}{got}',
+                    style="error",
+                    verbosity=Verbosity.NORMAL,
+                )
+                return 1
+            finally:
+                profiler.finish()
             if failures:
                 self.line(
                     "These are the failures:", style="error", verbosity=Verbosity.NORMAL
@@ -39,6 +59,8 @@ class BackupCommand(Command):
                     style="error",
                     verbosity=Verbosity.NORMAL,
                 )
+            if self.option("profile"):
+                self.line("\n".join(profiler.report()), verbosity=Verbosity.NORMAL)
 
 
 if __name__ == "__main__":
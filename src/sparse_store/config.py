@@ -1,8 +1,11 @@
 import itertools
+import os
 import pathlib
 from typing import Any, Iterable, List, Optional
 import yaml
 
+from .metadata import MetadataTable
+
 # Exceptions
 
 
@@ -26,6 +29,22 @@ class UnexpectedTypeFormatException(FormatException):
     pass
 
 
+class InvalidDeltaSettingFormatException(FormatException):
+    "delta: threshold: should be null or a non-negative integer, block_size: a positive integer"
+    pass
+
+
+class UnknownSymlinkPolicyFormatException(FormatException):
+    "links: symlinks: should be one of preserve, follow or skip"
+    pass
+
+
+# Defaults
+
+DEFAULT_DELTA_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_DELTA_BLOCK_SIZE = 64 * 1024
+SYMLINK_POLICIES = ("preserve", "follow", "skip")
+
 # Functions
 
 
@@ -34,6 +53,21 @@ def get_backup_section(obj):
     return obj["backup"]
 
 
+def get_delta_section(obj):
+    "Return optional delta sync part of sparse_store.yaml file"
+    return obj.get("delta") or {}
+
+
+def get_links_section(obj):
+    "Return optional link handling part of sparse_store.yaml file"
+    return obj.get("links") or {}
+
+
+def get_metadata_section(obj):
+    "Return optional metadata capture part of sparse_store.yaml file"
+    return obj.get("metadata") or {}
+
+
 def dump_yaml(object):
     "Turn object into YAML"
     return yaml.dump(object, default_flow_style=False)
@@ -44,6 +78,11 @@ def load_yaml(stream):
     return yaml.safe_load(stream)
 
 
+def is_integer(value) -> bool:
+    "Whether parsed YAML `value` is an integer (YAML booleans are not)"
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
 def path(prefix: Optional[pathlib.Path], value: str) -> pathlib.Path:
     if prefix is None:
         return pathlib.Path(value)
@@ -103,7 +142,7 @@ def convert_backup_section_to_commands(backup: List[Any]) -> Iterable[Command]:
     * str ==>
       * dir?  ==> DirectoryWithAllContents(prefix / .)
       * file? ==> File(.)
-    
+
     TODO: Come up with a better type than List[Any]
 
     """
@@ -163,6 +202,12 @@ class Config:
     def backup_path(self):
         return self.project_path / "backup"
 
+    def signature_path(self):
+        return self.project_path / "signatures"
+
+    def metadata_file(self):
+        return self.project_path / "metadata.json"
+
     def dump(self):
         "Write config"
         self.config_file().write_text(dump_yaml(self.parsed_yaml), encoding="UTF-8")
@@ -170,8 +215,15 @@ class Config:
     def load(self):
         "Read config"
         with self.config_file().open(mode="rt", encoding="UTF-8") as stream:
+            self.loaded_mtime_ns = os.fstat(stream.fileno()).st_mtime_ns
             self.parsed_yaml = load_yaml(stream)
 
+    def is_stale(self):
+        "Whether the config file changed since it was loaded"
+        if not self.is_loaded():
+            return True
+        return self.config_file().stat().st_mtime_ns != self.loaded_mtime_ns
+
     def is_loaded(self):
         try:
             self.parsed_yaml
@@ -187,6 +239,56 @@ class Config:
         self.ensure_loaded()
         return get_backup_section(self.parsed_yaml)
 
+    def delta_threshold(self) -> Optional[int]:
+        "Size from which files are updated by block delta; None disables"
+        self.ensure_loaded()
+        threshold = get_delta_section(self.parsed_yaml).get(
+            "threshold", DEFAULT_DELTA_THRESHOLD
+        )
+        if threshold is not None and not (is_integer(threshold) and threshold >= 0):
+            raise InvalidDeltaSettingFormatException(threshold)
+        return threshold
+
+    def delta_block_size(self) -> int:
+        self.ensure_loaded()
+        block_size = get_delta_section(self.parsed_yaml).get(
+            "block_size", DEFAULT_DELTA_BLOCK_SIZE
+        )
+        if not (is_integer(block_size) and block_size > 0):
+            raise InvalidDeltaSettingFormatException(block_size)
+        return block_size
+
+    def symlink_policy(self) -> str:
+        "How symlinks inside backed-up directories are stored"
+        self.ensure_loaded()
+        policy = get_links_section(self.parsed_yaml).get("symlinks", "preserve")
+        if policy not in SYMLINK_POLICIES:
+            raise UnknownSymlinkPolicyFormatException(policy)
+        return policy
+
+    def hardlinks(self) -> bool:
+        "Whether hard-linked files are stored once and linked"
+        self.ensure_loaded()
+        return get_links_section(self.parsed_yaml).get("hardlinks", True)
+
+    def validate(self):
+        "Raise a FormatException if any section of the config is invalid"
+        convert_backup_section_to_commands(self.backup())
+        self.delta_threshold()
+        self.delta_block_size()
+        self.symlink_policy()
+        self.metadata_table()
+
+    def metadata_table(self) -> MetadataTable:
+        "Empty metadata table, capturing what sparse_store.yaml asks for"
+        self.ensure_loaded()
+        section = get_metadata_section(self.parsed_yaml)
+        return MetadataTable(
+            self.metadata_file(),
+            owner=section.get("owner", False),
+            xattrs=section.get("xattrs", False),
+        )
+
 
 if __name__ == "__main__":
     config = Config(pathlib.Path("C:") / "sparse_store")
@@ -0,0 +1,173 @@
+import json
+import pathlib
+import socket
+from stat import S_ISSOCK
+import threading
+import time
+from typing import Callable, Optional
+
+from .profiling import Profiler
+from .store import BackupResult
+from .store import Store
+
+
+class SocketInUse(Exception):
+    "The daemon's socket path is taken by another file or a live daemon"
+    pass
+
+
+def remove_stale_socket(socket_path: pathlib.Path):
+    """Remove a socket left behind by a daemon that is no longer running
+
+    Raises SocketInUse if `socket_path` is not a socket or something is
+    still listening on it.
+    """
+    try:
+        mode = socket_path.lstat().st_mode
+    except FileNotFoundError:
+        return
+    if not S_ISSOCK(mode):
+        raise SocketInUse(f"{socket_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(socket_path))
+        except ConnectionRefusedError:
+            socket_path.unlink()
+            return
+    raise SocketInUse(f"Another daemon is listening on {socket_path}")
+
+
+def send_request(socket_path: pathlib.Path, request: str = "backup") -> dict:
+    "Ask a running daemon listening on `socket_path` to perform `request`"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        client.sendall(f"{request}\n".encode("UTF-8"))
+        with client.makefile(mode="r", encoding="UTF-8") as stream:
+            return json.loads(stream.readline())
+
+
+def describe(exception: Exception) -> str:
+    return f"{exception.__class__.__name__}: {exception}"
+
+
+class Daemon:
+    """Run backups of one Store repeatedly, keeping its state warm
+
+    Backups run every `interval` seconds and whenever a client sends
+    "backup" on the Unix socket at `socket_path`; "stop" ends serve().
+    Either trigger may be left out.
+    """
+
+    def __init__(
+        self,
+        store: Store,
+        interval: Optional[float] = None,
+        socket_path: Optional[pathlib.Path] = None,
+        on_result: Optional[Callable[[BackupResult], None]] = None,
+        profiler_factory: Optional[Callable[[], Profiler]] = None,
+        client_timeout: float = 5.0,
+    ):
+        self.store = store
+        self.interval = interval
+        self.socket_path = socket_path
+        self.on_result = on_result
+        self.profiler_factory = profiler_factory
+        # Seconds to wait on a client's socket, so a silent one cannot stall
+        # serve(); backups themselves are not limited
+        self.client_timeout = client_timeout
+        # Set once serve() accepts requests on the socket
+        self.ready = threading.Event()
+
+    def run_once(self) -> BackupResult:
+        """Back up once; with a profiler_factory, each run gets a fresh Profiler
+
+        Errors are returned in the result's `error` rather than raised, so
+        the daemon keeps running. If sparse_store.yaml fails to reload, as
+        after an invalid edit, the backup still runs with the last good
+        config and the reload error is reported alongside.
+        """
+        start = time.perf_counter()
+        reload_error = None
+        try:
+            self.store.refresh()
+        except Exception as exception:
+            reload_error = describe(exception)
+        try:
+            if self.profiler_factory is None:
+                result = self.store.backup()
+            else:
+                self.store.profiler = self.profiler_factory()
+                self.store.profiler.start()
+                try:
+                    result = self.store.backup()
+                finally:
+                    self.store.profiler.finish()
+        except Exception as exception:
+            result = BackupResult(
+                [], {}, {}, time.perf_counter() - start, error=describe(exception)
+            )
+        if reload_error is not None and self.store.config.is_loaded():
+            result.error = f"Kept the last good config: {reload_error}"
+        elif reload_error is not None:
+            result.error = reload_error
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+    def handle(self, connection: socket.socket) -> bool:
+        "Answer one client; False once asked to stop"
+        request = None
+        try:
+            with connection, connection.makefile(mode="rw", encoding="UTF-8") as stream:
+                request = stream.readline().strip()
+                if request == "backup":
+                    response = self.run_once().as_dict()
+                elif request == "stop":
+                    response = {"stopped": True}
+                else:
+                    response = {"error": f"Unknown request {request!r}"}
+                stream.write(json.dumps(response) + "\n")
+                stream.flush()
+        except OSError:
+            # The client went away; there is no one left to answer
+            pass
+        return request != "stop"
+
+    def serve(self):
+        if self.interval is None and self.socket_path is None:
+            raise ValueError("Daemon needs an interval, a socket path or both")
+        if self.interval is not None and not self.interval > 0:
+            raise ValueError(f"Daemon interval must be positive, not {self.interval}")
+        server = None
+        if self.socket_path is not None:
+            remove_stale_socket(self.socket_path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(str(self.socket_path))
+            server.listen()
+        self.ready.set()
+        try:
+            next_run = time.monotonic()
+            running = True
+            while running:
+                timeout = None
+                if self.interval is not None:
+                    timeout = next_run - time.monotonic()
+                    if timeout <= 0:
+                        self.run_once()
+                        next_run = time.monotonic() + self.interval
+                        continue
+                if server is None:
+                    time.sleep(timeout)
+                    continue
+                server.settimeout(timeout)
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(self.client_timeout)
+                running = self.handle(connection)
+        finally:
+            self.ready.clear()
+            if server is not None:
+                server.close()
+                self.socket_path.unlink()
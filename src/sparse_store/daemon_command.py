@@ -0,0 +1,92 @@
+import math
+import pathlib
+
+from cleo import Command
+
+from .daemon import Daemon
+from .daemon import SocketInUse
+from .profiling import build_profiler
+from .store import Store
+from .verbosity import Verbosity
+
+
+class DaemonCommand(Command):
+    """
+    Backs up to a sparse_store repeatedly, keeping configuration and state in memory
+
+    daemon
+        {path : path to create for sparse_store and configuration}
+        {--interval= : If set, back up every this many seconds}
+        {--socket= : If set, also back up on request over this Unix socket}
+        {--profile : If set, show per-stage timings and counters after each backup}
+        {--profile-output= : If set, write cProfile stats of the last backup to this file}
+        {--profile-textfile= : If set, write metrics of the last backup to this Prometheus textfile for node_exporter}
+    """
+
+    def handle(self):
+        path = pathlib.Path(self.argument("path"))
+        interval = self.option("interval")
+        socket_path = self.option("socket")
+        if not interval and not socket_path:
+            self.line("Please give --interval, --socket or both.", style="error")
+            return 1
+        if interval:
+            try:
+                interval = float(interval)
+            except ValueError:
+                interval = math.nan
+            if not (math.isfinite(interval) and interval > 0):
+                self.line(
+                    f'--interval must be a positive number of seconds, not "{self.option("interval")}".',
+                    style="error",
+                )
+                return 1
+
+        store = Store(path, io=self.io, perform=True)
+        daemon = self.daemon = Daemon(
+            store,
+            interval=interval or None,
+            socket_path=pathlib.Path(socket_path) if socket_path else None,
+            on_result=self.report,
+            profiler_factory=self.profiler_factory(),
+        )
+        self.line(f'Store: "{store.project_path}"', verbosity=Verbosity.NORMAL)
+        if socket_path:
+            self.line(f'Listening on "{socket_path}"', verbosity=Verbosity.NORMAL)
+        try:
+            daemon.serve()
+        except KeyboardInterrupt:
+            pass
+        except SocketInUse as exception:
+            self.line(str(exception), style="error")
+            return 1
+        self.line("Stopped.", verbosity=Verbosity.NORMAL)
+
+    def profiler_factory(self):
+        textfile = self.option("profile-textfile")
+        cprofile_output = self.option("profile-output")
+        if not (self.option("profile") or textfile or cprofile_output):
+            return None
+        return lambda: build_profiler(textfile, cprofile_output)
+
+    def report(self, result):
+        if result.error is not None:
+            self.line(f"Error: {result.error}", style="error")
+        if not result.counters:
+            return
+        counters = result.counters
+        self.line(
+            f"Backup finished in {result.elapsed:.3f}s: {counters['copies']} copied, {counters['skips']} up to date, {len(result.failures)} failed",
+            verbosity=Verbosity.NORMAL,
+        )
+        if result.failures:
+            self.line(
+                "\n".join(str(f) for f in result.failures),
+                style="error",
+                verbosity=Verbosity.NORMAL,
+            )
+        if self.option("profile"):
+            self.line(
+                "\n".join(self.daemon.store.profiler.report()),
+                verbosity=Verbosity.NORMAL,
+            )
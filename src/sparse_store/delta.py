@@ -0,0 +1,95 @@
+import hashlib
+import os
+import pathlib
+import shutil
+import struct
+from typing import List, Optional
+
+# Signature file layout: header, then one digest per block of the stored copy
+HEADER = struct.Struct("<QQQ")  # block_size, size, mtime_ns of the stored copy
+DIGEST_SIZE = 16
+
+
+def block_digest(block: bytes) -> bytes:
+    return hashlib.blake2b(block, digest_size=DIGEST_SIZE).digest()
+
+
+def compute_signatures(path: pathlib.Path, block_size: int) -> List[bytes]:
+    "Digest of every block of `path`"
+    with path.open(mode="rb") as stream:
+        return [
+            block_digest(block) for block in iter(lambda: stream.read(block_size), b"")
+        ]
+
+
+def read_signatures(
+    signature_file: pathlib.Path, stored_file: pathlib.Path, block_size: int
+) -> Optional[List[bytes]]:
+    """Cached signatures of `stored_file`, or None if the cache is missing
+    or stale"""
+    try:
+        data = signature_file.read_bytes()
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    stat = stored_file.stat()
+    if HEADER.unpack_from(data) != (block_size, stat.st_size, stat.st_mtime_ns):
+        return None
+    body = data[HEADER.size :]
+    return [body[i : i + DIGEST_SIZE] for i in range(0, len(body), DIGEST_SIZE)]
+
+
+def write_signatures(
+    signature_file: pathlib.Path,
+    stored_file: pathlib.Path,
+    block_size: int,
+    signatures: List[bytes],
+):
+    stat = stored_file.stat()
+    signature_file.parent.mkdir(parents=True, exist_ok=True)
+    temporary_file = signature_file.with_name(f".{signature_file.name}.tmp")
+    temporary_file.write_bytes(
+        HEADER.pack(block_size, stat.st_size, stat.st_mtime_ns) + b"".join(signatures)
+    )
+    os.replace(temporary_file, signature_file)
+
+
+def delta_copy(
+    source: pathlib.Path,
+    destination: pathlib.Path,
+    signature_file: pathlib.Path,
+    block_size: int,
+) -> int:
+    """Bring existing `destination` up to date with `source` in place
+
+    Only blocks whose digest differs from the stored copy's are rewritten.
+    The stored copy's digests come from `signature_file` when it is still
+    valid, so the stored side is only read when the cache is stale.
+    Metadata is copied as by shutil.copy2. Returns the number of bytes
+    written.
+    """
+    signatures = read_signatures(signature_file, destination, block_size)
+    if signatures is None:
+        signatures = compute_signatures(destination, block_size)
+    new_signatures = []
+    written = 0
+    size = 0
+    with source.open(mode="rb") as source_stream, destination.open(
+        mode="r+b"
+    ) as destination_stream:
+        for index, block in enumerate(
+            iter(lambda: source_stream.read(block_size), b"")
+        ):
+            digest = block_digest(block)
+            new_signatures.append(digest)
+            size += len(block)
+            if index < len(signatures) and signatures[index] == digest:
+                continue
+            destination_stream.seek(index * block_size)
+            destination_stream.write(block)
+            written += len(block)
+        destination_stream.truncate(size)
+    shutil.copystat(source, destination)
+    write_signatures(signature_file, destination, block_size, new_signatures)
+    return written
@@ -76,5 +76,17 @@ backup:
   - relative_dir_path2.1: # Full path is "{path_2}/{relative_dir_path2.1}"
   - relative_file_path_2.1.1 # Full path is "{path_2}/{relative_dir_path2.1}/{relative_file_path_2.1.1}"
     - relative_file_path_2.2 # Full path is "{path_2}/{relative_file_path_2.2}"
+# Optional: files at least `threshold` bytes are updated block by block
+# delta:
+#   threshold: 67108864 # Use null to always copy whole files
+#   block_size: 65536
+# Optional: how links inside backed-up directories are stored
+# links:
+#   symlinks: preserve # or follow, or skip
+#   hardlinks: true # Store hard-linked files once and link them in the store
+# Optional: also record owners and xattrs (including ACLs) in metadata.json
+# metadata:
+#   owner: true
+#   xattrs: true
 """
             )
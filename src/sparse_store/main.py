@@ -3,6 +3,7 @@
 from . import __version__
 from .init_command import InitCommand
 from .backup_command import BackupCommand
+from .daemon_command import DaemonCommand
 from .restore_command import RestoreCommand
 from cleo import Application as BaseApplication
 
@@ -29,7 +30,7 @@ class Application(BaseApplication):
 
     def get_commands(self):
         "List of commands"
-        commands = [InitCommand(), BackupCommand(), RestoreCommand()]
+        commands = [InitCommand(), BackupCommand(), RestoreCommand(), DaemonCommand()]
         return commands
 
 
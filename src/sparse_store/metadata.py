@@ -0,0 +1,103 @@
+import base64
+import json
+import os
+import pathlib
+from stat import S_IFMT
+from typing import Dict, Optional
+
+
+def read_xattrs(path: pathlib.Path) -> Dict[str, str]:
+    """Extended attributes of `path`, base64-encoded
+
+    POSIX ACLs are stored as the system.posix_acl_* attributes, so they are
+    captured here too. Returns nothing where xattrs are unsupported.
+    """
+    if not hasattr(os, "listxattr"):
+        return {}
+    try:
+        return {
+            name: base64.b64encode(os.getxattr(path, name)).decode("ascii")
+            for name in os.listxattr(path)
+        }
+    except OSError:
+        return {}
+
+
+def is_fresh(stat: os.stat_result, record: Optional[dict]) -> bool:
+    "Whether the contents of the stored copy described by `record` match `stat`"
+    return (
+        record is not None
+        and record["mtime_ns"] == stat.st_mtime_ns
+        and record["size"] == stat.st_size
+        and S_IFMT(record["mode"]) == S_IFMT(stat.st_mode)
+    )
+
+
+class MetadataTable:
+    """Sidecar table of metadata for stored files, keyed by original path
+
+    Freshness checks consult this table instead of stat-ing the stored copy,
+    and ownership and xattrs are recorded here rather than applied to the
+    stored copies. The table is read once and written once per run.
+    """
+
+    def __init__(self, path: pathlib.Path, owner: bool = False, xattrs: bool = False):
+        self.path = path
+        self.owner = owner
+        self.xattrs = xattrs
+        self.entries: Dict[str, dict] = {}
+
+    def load(self):
+        try:
+            with self.path.open(mode="rt", encoding="UTF-8") as stream:
+                self.entries = json.load(stream)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def dump(self):
+        temporary_path = self.path.with_name(f".{self.path.name}.tmp")
+        with temporary_path.open(mode="wt", encoding="UTF-8") as stream:
+            json.dump(self.entries, stream, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+    def get(self, path: pathlib.Path) -> Optional[dict]:
+        return self.entries.get(str(path))
+
+    def metadata_changed(self, path: pathlib.Path, stat: os.stat_result) -> bool:
+        """Whether the mode, owner or xattrs of `path` may have changed since
+        it was recorded
+
+        chmod, chown and xattr changes leave mtime alone but bump ctime, so
+        this needs only the stat already taken.
+        """
+        record = self.get(path)
+        if record is None:
+            return False
+        return (
+            record.get("ctime_ns") != stat.st_ctime_ns
+            or record["mode"] != stat.st_mode
+            or self.owner
+            and (record.get("uid"), record.get("gid")) != (stat.st_uid, stat.st_gid)
+        )
+
+    def record(self, path: pathlib.Path, stat: os.stat_result):
+        entry = {
+            "mtime_ns": stat.st_mtime_ns,
+            "ctime_ns": stat.st_ctime_ns,
+            "size": stat.st_size,
+            "mode": stat.st_mode,
+        }
+        if self.owner:
+            entry["uid"] = stat.st_uid
+            entry["gid"] = stat.st_gid
+        if self.xattrs:
+            entry["xattrs"] = read_xattrs(path)
+        self.entries[str(path)] = entry
+
+    def forget(self, path: pathlib.Path):
+        "Drop entries for `path` and anything below it"
+        prefix = os.path.join(str(path), "")
+        for key in [
+            key for key in self.entries if key == str(path) or key.startswith(prefix)
+        ]:
+            del self.entries[key]
@@ -1,10 +1,17 @@
+import os
 import pathlib
 import re
 import shutil
-from typing import Iterable
+from stat import S_ISDIR, S_ISLNK, S_ISREG
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from clikit.api.io import IO
+from clikit.io import NullIO
 
+from .delta import delta_copy
+from .metadata import is_fresh
+from .metadata import MetadataTable
+from .profiling import Profiler
 from .verbosity import Verbosity
 
 
@@ -20,53 +27,97 @@ def storage_path(base: pathlib.Path, path: pathlib.Path) -> pathlib.Path:
     return base / encode_path(path)
 
 
-def compare_files(original_file: pathlib.Path, backup_file: pathlib.Path) -> int:
-    """Returns an element of {-1, 0, 1} to indicate which has been updated latest
-    
-    * -1 = backup_file has been modified more recently
-    *  0 = the timestamps match
-    *  1 = original_file has been modified more recently 
-    """
+def remove_path(path: pathlib.Path, stat: os.stat_result):
+    "Remove `path`, whose lstat is `stat`, whatever kind of file it is"
+    if S_ISDIR(stat.st_mode):
+        shutil.rmtree(path)
+    else:
+        path.unlink()
 
-    def cmp(a, b):
-        return (a > b) - (b > a)
 
-    return cmp(original_file.stat().st_mtime, backup_file.stat().st_mtime)
+def clear_destination(
+    destination: pathlib.Path, is_kind: Callable[[int], bool]
+) -> Optional[os.stat_result]:
+    """Remove `destination` unless `is_kind` accepts its mode
 
+    Stored symlinks are never accepted, so writing a file or entering a
+    directory can never follow one out of the store. Returns the lstat of
+    what is left, or None.
+    """
+    try:
+        stat = destination.lstat()
+    except FileNotFoundError:
+        return None
+    if S_ISLNK(stat.st_mode) or not is_kind(stat.st_mode):
+        remove_path(destination, stat)
+        return None
+    return stat
 
-def ignore_up_to_date(store_backup_path: pathlib.Path) -> Iterable[pathlib.Path]:
-    """Higher-level function to return a callable for shutil.copytree
-    to pass to the ignore parameter"""
 
-    def _ignore_up_to_date(current_directory, directory_contents):
-        current_directory = pathlib.Path(current_directory)
-        directory_contents = (current_directory / child for child in directory_contents)
-        stored_directory_contents = (
-            storage_path(store_backup_path, child) for child in directory_contents
-        )
-        already_up_to_date_contents = (
-            path
-            for path, stored_path in zip(directory_contents, stored_directory_contents)
-            if not path.is_dir()
-            and stored_path.exists()
-            and compare_files(path, stored_path) < 1
-        )
-        relative_paths_to_ignore = (
-            path.relative_to(current_directory) for path in already_up_to_date_contents
-        )
-        return relative_paths_to_ignore
+def is_up_to_date(
+    path: pathlib.Path,
+    stat: os.stat_result,
+    stored_path: pathlib.Path,
+    metadata: MetadataTable,
+    profiler: Profiler,
+    stored: Optional[bool] = None,
+    follow_symlinks: bool = True,
+) -> bool:
+    """Whether the stored copy of `path` matches `stat` exactly
 
-    return _ignore_up_to_date
+    Copies preserve mtime_ns, so the metadata table answers this without
+    touching the store. `stored` says whether the stored copy exists, when
+    the caller already knows from listing its directory; a missing copy is
+    never up to date. Only paths missing from the table, as in stores
+    written before it existed, fall back to stat-ing the stored copy, or
+    lstat-ing it when `follow_symlinks` is false.
+    """
+    if stored is False:
+        return False
+    record = metadata.get(path)
+    if record is not None:
+        return is_fresh(stat, record)
+    profiler.count("stats")
+    try:
+        stored_stat = os.stat(stored_path, follow_symlinks=follow_symlinks)
+    except FileNotFoundError:
+        return False
+    if (
+        stored_stat.st_mtime_ns == stat.st_mtime_ns
+        and stored_stat.st_size == stat.st_size
+    ):
+        metadata.record(path, stat)
+        return True
+    return False
 
 
 class BackupPath:
     "Wrapper of pathlib.Path to enable backup/restore functionality"
 
-    def __init__(self, path: pathlib.Path, config, io: IO, perform: bool = True):
+    def __init__(
+        self,
+        path: pathlib.Path,
+        config,
+        io: Optional[IO] = None,
+        perform: bool = True,
+        profiler: Optional[Profiler] = None,
+        metadata: Optional[MetadataTable] = None,
+        stored_inodes: Optional[Dict[Tuple[int, int], pathlib.Path]] = None,
+    ):
         self.path = path
         self.config = config
-        self.io = io
+        self.io = io or NullIO()
         self.perform = perform
+        self.profiler = profiler or Profiler()
+        self.metadata = metadata or config.metadata_table()
+        # (st_dev, st_ino) of hard-linked files already stored, shared by all
+        # BackupPaths of one backup so links across configured paths count
+        self._stored_inodes = {} if stored_inodes is None else stored_inodes
+        # (st_dev, st_ino) of the directories being walked, from the top down
+        # to the current one, to stop symlink loops back to an ancestor
+        self._ancestors: Set[Tuple[int, int]] = set()
+        # Entries that could not be backed up, as (reason, paths)
+        self.failures: List[tuple] = []
 
     def __str__(self):
         return f"{self.__class__.__name__}({self.path!r}, ...)"
@@ -78,8 +129,220 @@ class BackupPath:
     def storage_path(self):
         return storage_path(self.config.backup_path(), self.path)
 
+    def copy_file(
+        self, source: pathlib.Path, destination: pathlib.Path, stat: os.stat_result
+    ):
+        """Copy `source` over `destination`, as a block delta for large files
+        that are already stored, and record it in the metadata table
+
+        Both ways preserve mtime_ns exactly. A stored copy that is hard-linked
+        to others is replaced rather than overwritten, so the others keep
+        their contents, as is anything stored there that is not a file.
+        """
+        destination_stat = clear_destination(destination, S_ISREG)
+        if destination_stat is not None and destination_stat.st_nlink > 1:
+            destination.unlink()
+            destination_stat = None
+        threshold = self.config.delta_threshold()
+        if (
+            threshold is not None
+            and stat.st_size >= threshold
+            and destination_stat is not None
+            and S_ISREG(destination_stat.st_mode)
+        ):
+            with self.profiler.stage("delta"):
+                written = delta_copy(
+                    source,
+                    destination,
+                    storage_path(self.config.signature_path(), source),
+                    self.config.delta_block_size(),
+                )
+            self.profiler.count("bytes", written)
+        else:
+            with self.profiler.stage("copy"):
+                shutil.copy2(source, destination)
+            self.profiler.count("bytes", stat.st_size)
+        self.profiler.count("copies")
+        self.metadata.record(source, stat)
+
+    def link_file(
+        self, source: pathlib.Path, destination: pathlib.Path, stat: os.stat_result
+    ) -> bool:
+        """Store `source` as a hard link to an already stored file with the
+        same inode; False if there is none or the store cannot link"""
+        if not self.config.hardlinks() or stat.st_nlink < 2 or not stat.st_ino:
+            return False
+        linked = self._stored_inodes.get((stat.st_dev, stat.st_ino))
+        if linked is None:
+            return False
+        clear_destination(destination, lambda mode: False)
+        try:
+            os.link(linked, destination)
+        except OSError:
+            return False
+        self.profiler.count("links")
+        self.metadata.record(source, stat)
+        return True
+
+    def refresh_metadata(
+        self, source: pathlib.Path, destination: pathlib.Path, stat: os.stat_result
+    ):
+        """Bring the mode and recorded metadata of an up to date stored copy
+        in line with `source`, without copying its contents"""
+        if not self.perform or not self.metadata.metadata_changed(source, stat):
+            return
+        shutil.copystat(source, destination, follow_symlinks=not S_ISLNK(stat.st_mode))
+        self.metadata.record(source, stat)
+
+    def register_inode(self, destination: pathlib.Path, stat: os.stat_result):
+        "Remember `destination` as the stored copy of a hard-linked file"
+        if stat.st_nlink > 1 and stat.st_ino:
+            self._stored_inodes.setdefault((stat.st_dev, stat.st_ino), destination)
+
+    def copy_symlink(
+        self, source: pathlib.Path, destination: pathlib.Path, stat: os.stat_result
+    ):
+        clear_destination(destination, lambda mode: False)
+        os.symlink(os.readlink(source), destination)
+        # Keep mtime_ns exact for links too, where the platform allows it
+        if os.utime in os.supports_follow_symlinks:
+            os.utime(
+                destination,
+                ns=(stat.st_atime_ns, stat.st_mtime_ns),
+                follow_symlinks=False,
+            )
+        self.profiler.count("copies")
+        self.metadata.record(source, stat)
+
+    def copy_entry(
+        self,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        stat: os.stat_result,
+        stored: Optional[bool] = None,
+    ):
+        """Back up one directory entry according to the link policies
+
+        `stat` is from lstat, so symlinks are seen as such. `stored` is
+        whether `destination` exists, if known.
+        """
+        if S_ISLNK(stat.st_mode):
+            policy = self.config.symlink_policy()
+            if policy == "skip":
+                self.profiler.count("skips")
+                return
+            if policy == "preserve":
+                with self.profiler.stage("compare"):
+                    up_to_date = is_up_to_date(
+                        source,
+                        stat,
+                        destination,
+                        self.metadata,
+                        self.profiler,
+                        stored,
+                        follow_symlinks=False,
+                    )
+                if up_to_date:
+                    self.profiler.count("skips")
+                    self.refresh_metadata(source, destination, stat)
+                else:
+                    self.copy_symlink(source, destination, stat)
+                return
+            self.profiler.count("stats")
+            try:
+                stat = source.stat()
+            except FileNotFoundError:
+                self.io.write_line(
+                    self._add_class_name(f"Skipping dangling symlink {source!r}"),
+                    flags=Verbosity.VERBOSE,
+                )
+                self.profiler.count("skips")
+                return
+        if S_ISDIR(stat.st_mode):
+            self.copy_tree(source, destination, stat)
+        elif S_ISREG(stat.st_mode):
+            with self.profiler.stage("compare"):
+                up_to_date = is_up_to_date(
+                    source, stat, destination, self.metadata, self.profiler, stored
+                )
+            if up_to_date:
+                self.profiler.count("skips")
+                self.refresh_metadata(source, destination, stat)
+            elif not self.link_file(source, destination, stat):
+                self.copy_file(source, destination, stat)
+            self.register_inode(destination, stat)
+        else:
+            self.io.write_line(
+                self._add_class_name(f"Skipping special file {source!r}"),
+                flags=Verbosity.VERBOSE,
+            )
+            self.profiler.count("specials")
+
+    def copy_tree(
+        self, source: pathlib.Path, destination: pathlib.Path, stat: os.stat_result
+    ):
+        "Back up directory `source` entry by entry"
+        key = (stat.st_dev, stat.st_ino)
+        if not stat.st_ino:
+            self.copy_directory_contents(source, destination)
+            return
+        if key in self._ancestors:
+            self.io.write_line(
+                self._add_class_name(
+                    f"Skipping {source!r}, a symlink loop back to one of its parents"
+                ),
+                flags=Verbosity.VERBOSE,
+            )
+            self.profiler.count("skips")
+            return
+        self._ancestors.add(key)
+        try:
+            self.copy_directory_contents(source, destination)
+        finally:
+            self._ancestors.discard(key)
+
+    def copy_directory_contents(self, source: pathlib.Path, destination: pathlib.Path):
+        try:
+            clear_destination(destination, S_ISDIR)
+            destination.mkdir(parents=True, exist_ok=True)
+            # Listing the stored side catches stored copies that went missing
+            # without a stat per file
+            with os.scandir(destination) as entries:
+                stored_names = {entry.name for entry in entries}
+            with os.scandir(source) as entries:
+                entries = list(entries)
+        except OSError:
+            self.failures.append(("Error on copy directory", (source, destination)))
+            return
+        # Like shutil.copytree, carry on past entries that fail
+        for entry in entries:
+            entry_path = pathlib.Path(entry.path)
+            entry_destination = destination / entry.name
+            try:
+                self.profiler.count("stats")
+                self.copy_entry(
+                    entry_path,
+                    entry_destination,
+                    entry.stat(follow_symlinks=False),
+                    entry.name in stored_names,
+                )
+            except OSError:
+                self.io.write_line(
+                    self._add_class_name(
+                        f"Error! Could not copy {entry_path!r} to {entry_destination!r}"
+                    ),
+                    flags=Verbosity.NORMAL,
+                )
+                self.failures.append(("Error on copy", (entry_path, entry_destination)))
+        try:
+            shutil.copystat(source, destination)
+        except OSError:
+            self.failures.append(("Error on copy directory", (source, destination)))
+
     def remove_stored(self):
         storage_path = self.storage_path()
+        if self.perform:
+            self.metadata.forget(self.path)
         if not storage_path.exists():
             self.io.write_line(
                 self._add_class_name(f"Path {storage_path!r} not found; not deleting"),
@@ -100,21 +363,26 @@ class BackupPath:
             if self.perform:
                 storage_path.unlink()
 
-    def backup(self):
+    def backup(self) -> List[tuple]:
+        "Back up this path; returns the failures as (reason, paths)"
         storage_path = self.storage_path()
+        self.failures = []
         # try:
         #     self.remove_stored()
         # except PermissionError:
         #     return ("Permission error on removing stored", (storage_path, ))
-        if not self.path.exists():
+        self.profiler.count("stats")
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
             self.io.write_line(
                 self._add_class_name(
                     f"Warning! Path {self.path!r} not found. Cannot backup."
                 ),
                 flags=Verbosity.NORMAL,
             )
-            return ("Path not found", (self.path,))
-        elif self.path.is_dir():
+            return [("Path not found", (self.path,))]
+        if S_ISDIR(stat.st_mode):
             self.io.write_line(
                 self._add_class_name(
                     f"Copying directory {self.path!r} to {storage_path!r}"
@@ -122,64 +390,50 @@ class BackupPath:
                 flags=Verbosity.VERBOSE,
             )
             if self.perform:
-                try:
-                    storage_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copytree(
-                        self.path,
-                        storage_path,
-                        ignore=ignore_up_to_date(self.config.backup_path()),
-                        dirs_exist_ok=True,
-                    )
-                    return None
-                except PermissionError:
-                    return ("Error on copy directory", (self.path, storage_path))
-        elif self.path.is_file():
-            if storage_path.exists():
-                comparison = compare_files(self.path, storage_path)
-            else:
-                comparison = 1  # Needs update
-            if comparison == 1:
-                self.io.write_line(
-                    self._add_class_name(
-                        f"Copying file {self.path!r} to {storage_path!r}"
-                    ),
-                    flags=Verbosity.VERBOSE,
+                with self.profiler.stage("copy"):
+                    self.copy_tree(self.path, storage_path, stat)
+        elif S_ISREG(stat.st_mode):
+            with self.profiler.stage("compare"):
+                up_to_date = is_up_to_date(
+                    self.path,
+                    stat,
+                    storage_path,
+                    self.metadata,
+                    self.profiler,
+                    os.path.lexists(storage_path),
                 )
-                if self.perform:
-                    try:
-                        storage_path.parent.mkdir(parents=True, exist_ok=True)
-                        shutil.copy(self.path, storage_path)
-                    except:
-                        return ("Error on copy file", (self.path, storage_path))
-            elif comparison == 0:
+            if up_to_date:
+                self.profiler.count("skips")
+                self.refresh_metadata(self.path, storage_path, stat)
+                self.register_inode(storage_path, stat)
                 self.io.write_line(
                     self._add_class_name(
                         f"Already up to date. Not copying file {self.path!r} to {storage_path!r}"
                     ),
                     flags=Verbosity.VERBOSE,
                 )
-            elif comparison == -1:
-                self.io.write_line(
-                    self._add_class_name(
-                        f"Stored copy of {self.path!r} in {storage_path!r} is newer than original. Not copying file."
-                    ),
-                    flags=Verbosity.VERBOSE,
-                )
             else:
-                # We should never get here.
                 self.io.write_line(
                     self._add_class_name(
-                        f"Bad comparision between file {self.path!r} and stored file {storage_path!r}. Not copying file."
+                        f"Copying file {self.path!r} to {storage_path!r}"
                     ),
                     flags=Verbosity.VERBOSE,
                 )
+                if self.perform:
+                    try:
+                        storage_path.parent.mkdir(parents=True, exist_ok=True)
+                        if not self.link_file(self.path, storage_path, stat):
+                            self.copy_file(self.path, storage_path, stat)
+                    except:
+                        return [("Error on copy file", (self.path, storage_path))]
+                    self.register_inode(storage_path, stat)
         else:
             self.io.write_line(
-                self._add_class_name(f"Error! Unrecognized path {self.path!r}"),
-                flags=Verbosity.NORMAL,
+                self._add_class_name(f"Skipping special file {self.path!r}"),
+                flags=Verbosity.VERBOSE,
             )
-            return ("Unrecognized path", (self.path,))
-        return None
+            self.profiler.count("specials")
+        return self.failures
 
     def restore(self):
         self.io.write_line(
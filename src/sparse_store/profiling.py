@@ -0,0 +1,125 @@
+import abc
+import cProfile
+import contextlib
+import os
+import pathlib
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class ProfileHook(abc.ABC):
+    "Base class for consumers of a finished Profiler's metrics"
+
+    @abc.abstractmethod
+    def emit(self, profiler: "Profiler"):
+        "Export `profiler`'s timings and counters"
+
+
+class PrometheusTextfileHook(ProfileHook):
+    """Write metrics in Prometheus text exposition format
+
+    Meant for node_exporter's textfile collector, so the file is written to a
+    temporary name and renamed into place to avoid partial reads.
+    """
+
+    def __init__(self, path: pathlib.Path, prefix: str = "sparse_store"):
+        self.path = path
+        self.prefix = prefix
+
+    def lines(self, profiler: "Profiler") -> Iterable[str]:
+        stage_metric = f"{self.prefix}_stage_seconds"
+        yield f"# HELP {stage_metric} Time spent in each stage of the last run."
+        yield f"# TYPE {stage_metric} gauge"
+        for stage, seconds in profiler.timings.items():
+            yield f'{stage_metric}{{stage="{stage}"}} {seconds:.6f}'
+        for counter, value in profiler.counters.items():
+            metric = f"{self.prefix}_{counter}"
+            yield f"# HELP {metric} Number of {counter} in the last run."
+            yield f"# TYPE {metric} gauge"
+            yield f"{metric} {value}"
+
+    def emit(self, profiler: "Profiler"):
+        temporary_path = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        temporary_path.write_text(
+            "\n".join(self.lines(profiler)) + "\n", encoding="UTF-8"
+        )
+        os.replace(temporary_path, self.path)
+
+
+class Profiler:
+    """Per-stage timings and counters for a sparse_store run
+
+    Stages may nest; each stage is charged only with the time not spent in
+    the stages nested inside it, so the timings add up to the total.
+    """
+
+    COUNTERS = ("stats", "copies", "bytes", "skips", "links", "specials")
+
+    def __init__(
+        self,
+        hooks: Optional[List[ProfileHook]] = None,
+        cprofile_path: Optional[pathlib.Path] = None,
+    ):
+        self.hooks = hooks or []
+        self.cprofile_path = cprofile_path
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {counter: 0 for counter in self.COUNTERS}
+        self._stack: List[List] = []
+        self._cprofile = None
+
+    def count(self, counter: str, amount: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        "Time the enclosed block as stage `name`"
+        frame = [name, time.perf_counter(), 0.0]  # name, start, nested time
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def start(self):
+        if self.cprofile_path is not None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def finish(self):
+        "Stop profiling, dump cProfile stats if requested, and run the hooks"
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(str(self.cprofile_path))
+            self._cprofile = None
+        for hook in self.hooks:
+            hook.emit(self)
+
+    def report(self) -> List[str]:
+        "Human-readable breakdown"
+        total = sum(self.timings.values())
+        lines = ["Stage timings:"]
+        for stage, seconds in self.timings.items():
+            share = 100 * seconds / total if total else 0.0
+            lines.append(f"  {stage:<8} {seconds:10.4f}s {share:5.1f}%")
+        lines.append(f"  {'total':<8} {total:10.4f}s")
+        lines.append("Counters:")
+        for counter, value in self.counters.items():
+            lines.append(f"  {counter:<8} {value:10d}")
+        return lines
+
+
+def build_profiler(
+    textfile: Optional[str] = None, cprofile_output: Optional[str] = None
+) -> Profiler:
+    "Profiler configured from the --profile-textfile and --profile-output options"
+    hooks = []
+    if textfile:
+        hooks.append(PrometheusTextfileHook(pathlib.Path(textfile)))
+    return Profiler(
+        hooks=hooks,
+        cprofile_path=pathlib.Path(cprofile_output) if cprofile_output else None,
+    )
@@ -1,54 +1,168 @@
+import itertools
 import pathlib
-
-# from typing import
+import time
+from typing import Dict, List, Optional
 
 from clikit.api.io import IO
+from clikit.io import NullIO
 
 from .config import Config
 from .config import convert_backup_section_to_commands
 from .config import convert_commands_to_paths
 from .path import BackupPath
+from .profiling import Profiler
+
+
+class BackupResult:
+    "Outcome of Store.backup()"
+
+    def __init__(
+        self,
+        failures: List[tuple],
+        counters: Dict[str, int],
+        timings: Dict[str, float],
+        elapsed: float,
+        error: Optional[str] = None,
+    ):
+        self.failures = failures
+        self.counters = counters
+        self.timings = timings
+        self.elapsed = elapsed
+        # Set when the backup could not run as configured
+        self.error = error
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(failures={self.failures}, counters={self.counters}, elapsed={self.elapsed:.3f}, error={self.error!r})"
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures and self.error is None
+
+    def as_dict(self) -> dict:
+        result = {
+            "failures": [
+                [reason, [str(path) for path in paths]]
+                for reason, paths in self.failures
+            ],
+            "counters": self.counters,
+            "timings": self.timings,
+            "elapsed": self.elapsed,
+        }
+        if self.error is not None:
+            result["error"] = self.error
+        return result
 
 
 class Store:
     """Configuration and sparse file store
 
+    Usable as a library: `io` defaults to discarding output. The parsed
+    config, the list of paths to back up and the metadata table are kept
+    between calls, so repeated backups from one Store skip that work; call
+    refresh() to pick up edits to sparse_store.yaml.
     """
 
-    def __init__(self, path: pathlib.Path, io: IO, perform: bool = False):
-        self.project_path = path
+    def __init__(
+        self,
+        path: pathlib.Path,
+        io: Optional[IO] = None,
+        perform: bool = False,
+        profiler: Optional[Profiler] = None,
+    ):
+        self.project_path = pathlib.Path(path)
         self.config = Config(self.project_path)
         self.perform = perform
-        self.io = io
+        self.io = io or NullIO()
+        self.profiler = profiler or Profiler()
+        self.metadata = None
+        self.paths = None
+        # Hard-linked files stored so far in the current backup()
+        self.stored_inodes = {}
 
     def config_file(self):
         return self.config.config_file()
 
+    def refresh(self) -> bool:
+        """Drop cached state if sparse_store.yaml changed; True if it did
+
+        The changed file is loaded and checked before it replaces the current
+        config, so an invalid edit raises and the last good config stays.
+        """
+        if not self.config.is_stale():
+            return False
+        config = Config(self.project_path)
+        config.load()
+        config.validate()
+        self.config = config
+        self.metadata = None
+        self.paths = None
+        return True
+
     def backup_paths(self):
         """BackupPath objects for all configured backup paths
-        
-        
+
+
         Dispatches to Config to get list of files to backup
         """
         # Note: These are all generator expressions, so if you need
         #       to reuse them, wrap them with a `list()` function.
 
-        backup_section = self.config.backup()
-        commands = convert_backup_section_to_commands(backup_section)
-        paths = convert_commands_to_paths(commands)
+        with self.profiler.stage("load"):
+            backup_section = self.config.backup()
+            if self.paths is None:
+                # Fail before copying anything rather than partway through
+                self.config.validate()
+            if self.metadata is None:
+                self.metadata = self.config.metadata_table()
+                self.metadata.load()
+        if self.paths is None:
+            with self.profiler.stage("plan"):
+                commands = convert_backup_section_to_commands(backup_section)
+                self.paths = list(convert_commands_to_paths(commands))
         backup_paths = (
-            BackupPath(path, self.config, perform=self.perform, io=self.io)
-            for path in paths
+            BackupPath(
+                path,
+                self.config,
+                perform=self.perform,
+                io=self.io,
+                profiler=self.profiler,
+                metadata=self.metadata,
+                stored_inodes=self.stored_inodes,
+            )
+            for path in self.paths
         )
         return backup_paths
 
-    def backup(self):
-        """Backup all files we find"""
+    def backup(self) -> BackupResult:
+        """Backup all files we find
+
+        The result's counters and timings cover this call only, even when
+        the profiler is shared between calls.
+        """
+        counters = dict(self.profiler.counters)
+        timings = dict(self.profiler.timings)
+        start = time.perf_counter()
+        self.stored_inodes = {}
         all_calls = (backup_path.backup() for backup_path in self.backup_paths())
-        failures = filter(None, all_calls)
-        return list(failures)
+        failures = list(itertools.chain.from_iterable(all_calls))
+        if self.perform:
+            self.metadata.dump()
+        return BackupResult(
+            failures,
+            {
+                counter: value - counters.get(counter, 0)
+                for counter, value in self.profiler.counters.items()
+            },
+            {
+                stage: seconds - timings.get(stage, 0.0)
+                for stage, seconds in self.profiler.timings.items()
+            },
+            time.perf_counter() - start,
+        )
 
     def remove_stored(self):
         """Remove stored copies of all files we find"""
         for backup_path in self.backup_paths():
             backup_path.remove_stored()
+        if self.perform:
+            self.metadata.dump()
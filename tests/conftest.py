@@ -2,12 +2,15 @@ import pytest
 
 from cleo import Application
 from cleo import CommandTester
+from clikit.io import BufferedIO
 
+from sparse_store import dump_yaml
 from sparse_store import Store
 from sparse_store import InitCommand
 
 # cleo-related
 
+
 @pytest.fixture(scope="session")
 def init_command():
     "init command"
@@ -22,18 +25,40 @@ def init_tester(init_command):
     "tester fir init subcommand"
     return CommandTester(init_command)
 
+
+@pytest.fixture(scope="function")
+def buffered_io():
+    "clikit IO capturing output in memory"
+    return BufferedIO()
+
+
 # depending on command
 
+
 @pytest.fixture(scope="function")
 def project_path(tmp_path):
     "project path for sparse_store"
     return tmp_path / "sparse_store"
 
 
-# FIXME: Passing init_command to store is a hack that needs to be fixed.
-
 @pytest.fixture(scope="function")
-def store(project_path, init_command):
+def store(project_path):
     "sparse_store in temporary directory"
-    return Store(project_path, init_command.io)
+    return Store(project_path)
+
+
+@pytest.fixture(scope="function")
+def make_store(project_path):
+    """factory for performing stores in project_path
+
+    Writes sparse_store.yaml from `config` when given, otherwise reuses the
+    one already written, as for a second run.
+    """
+
+    def make(config=None, io=None, perform=True, profiler=None):
+        (project_path / "backup").mkdir(parents=True, exist_ok=True)
+        if config is not None:
+            (project_path / "sparse_store.yaml").write_text(dump_yaml(config))
+        return Store(project_path, io, perform=perform, profiler=profiler)
 
+    return make
@@ -0,0 +1,123 @@
+import socket
+import threading
+
+import pytest
+
+from sparse_store import Daemon
+from sparse_store import send_request
+from sparse_store import Store
+from sparse_store.daemon import remove_stale_socket
+from sparse_store.daemon import SocketInUse
+
+
+def test_daemon_backs_up_on_request(tmp_path, make_store):
+    first = tmp_path / "first.txt"
+    second = tmp_path / "second.txt"
+    first.write_text("one")
+    second.write_text("two")
+    store = make_store({"backup": [str(first)]})
+    config_file = store.config_file()
+    socket_path = tmp_path / "daemon.sock"
+    daemon = Daemon(store, socket_path=socket_path)
+
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    try:
+        assert daemon.ready.wait(timeout=5)
+        response = send_request(socket_path)
+        assert response["failures"] == []
+        assert response["counters"]["copies"] == 1
+
+        config_file.write_text(f"backup:\n- {first}\n- {second}\n")
+        response = send_request(socket_path)
+        assert response["counters"]["copies"] == 1
+        assert response["counters"]["skips"] == 1
+
+        assert "error" in send_request(socket_path, "bogus")
+    finally:
+        if daemon.ready.is_set():
+            assert send_request(socket_path, "stop") == {"stopped": True}
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert not socket_path.exists()
+
+
+def test_daemon_keeps_last_good_config(tmp_path, make_store):
+    source = tmp_path / "source.txt"
+    source.write_text("one")
+    store = make_store({"backup": [str(source)]})
+    config_file = store.config_file()
+    results = []
+    daemon = Daemon(store, on_result=results.append)
+    assert daemon.run_once().ok
+
+    config_file.write_text("backup: [\n")
+    source.write_text("two")
+    result = daemon.run_once()
+    assert "ParserError" in result.error
+    assert result.counters["copies"] == 1
+    assert results[-1] is result
+    assert "error" in result.as_dict()
+
+    config_file.write_text(f"backup:\n- {source}\ndelta:\n  block_size: 0\n")
+    assert "InvalidDeltaSettingFormatException" in daemon.run_once().error
+    assert daemon.store.config.delta_block_size() > 0
+
+    config_file.write_text(f"backup:\n- {source}\n")
+    assert daemon.run_once().ok
+
+
+def test_daemon_reports_missing_config(project_path):
+    result = Daemon(Store(project_path, perform=True)).run_once()
+    assert "FileNotFoundError" in result.error
+
+
+def test_daemon_only_replaces_stale_sockets(tmp_path, store):
+    socket_path = tmp_path / "daemon.sock"
+    daemon = Daemon(store, socket_path=socket_path)
+
+    socket_path.write_text("not a socket")
+    with pytest.raises(SocketInUse):
+        daemon.serve()
+    assert socket_path.read_text() == "not a socket"
+    socket_path.unlink()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as live:
+        live.bind(str(socket_path))
+        live.listen()
+        with pytest.raises(SocketInUse):
+            daemon.serve()
+        assert socket_path.exists()
+
+    # Closed without unlinking, as after a crash
+    remove_stale_socket(socket_path)
+    assert not socket_path.exists()
+
+
+def test_silent_client_does_not_stall_daemon(tmp_path, make_store):
+    source = tmp_path / "source.txt"
+    source.write_text("one")
+    socket_path = tmp_path / "daemon.sock"
+    daemon = Daemon(
+        make_store({"backup": [str(source)]}),
+        socket_path=socket_path,
+        client_timeout=0.1,
+    )
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    try:
+        assert daemon.ready.wait(timeout=5)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as silent:
+            silent.connect(str(socket_path))
+            assert send_request(socket_path)["failures"] == []
+    finally:
+        if daemon.ready.is_set():
+            send_request(socket_path, "stop")
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+@pytest.mark.parametrize("interval", [0, -1])
+def test_daemon_rejects_non_positive_interval(store, interval):
+    with pytest.raises(ValueError):
+        Daemon(store, interval=interval).serve()
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from sparse_store import delta_copy
+from sparse_store import Profiler
+from sparse_store.config import InvalidDeltaSettingFormatException
+from sparse_store.delta import read_signatures
+
+BLOCK_SIZE = 4
+
+
+def test_delta_copy_rewrites_changed_blocks(tmp_path):
+    source = tmp_path / "source"
+    destination = tmp_path / "destination"
+    signature_file = tmp_path / "signatures" / "destination"
+    destination.write_bytes(b"aaaabbbbccccdddd")
+    source.write_bytes(b"aaaaXbbbccccdd")
+
+    written = delta_copy(source, destination, signature_file, BLOCK_SIZE)
+
+    assert written == 4 + 2
+    assert destination.read_bytes() == b"aaaaXbbbccccdd"
+    assert read_signatures(signature_file, destination, BLOCK_SIZE) is not None
+
+
+def test_delta_copy_uses_signature_cache(tmp_path):
+    source = tmp_path / "source"
+    destination = tmp_path / "destination"
+    signature_file = tmp_path / "destination.sig"
+    destination.write_bytes(b"aaaabbbb")
+    source.write_bytes(b"aaaabbbbcccc")
+    delta_copy(source, destination, signature_file, BLOCK_SIZE)
+
+    source.write_bytes(b"aaaaBBBBcccc")
+    assert delta_copy(source, destination, signature_file, BLOCK_SIZE) == 4
+    assert destination.read_bytes() == b"aaaaBBBBcccc"
+
+
+def test_backup_uses_delta_above_threshold(tmp_path, make_store, buffered_io):
+    source = tmp_path / "big.db"
+    source.write_bytes(b"x" * 64)
+    config = {"backup": [str(source)], "delta": {"threshold": 32, "block_size": 16}}
+    make_store(config, buffered_io).backup()
+
+    source.write_bytes(b"x" * 16 + b"y" * 16 + b"x" * 32)
+    os.utime(source, ns=(0, 0))
+    stored = make_store(io=buffered_io, perform=False).config.backup_path()
+    stored_file = next(p for p in stored.rglob("big.db"))
+    profiler = Profiler()
+    store = make_store(io=buffered_io, profiler=profiler)
+    assert store.backup().failures == []
+    assert profiler.counters["bytes"] == 16
+    assert stored_file.read_bytes() == source.read_bytes()
+
+
+@pytest.mark.parametrize(
+    "delta", [{"block_size": 0}, {"block_size": "64k"}, {"threshold": -1}]
+)
+def test_invalid_delta_settings(make_store, delta):
+    config = make_store({"backup": [], "delta": delta}, perform=False).config
+
+    with pytest.raises(InvalidDeltaSettingFormatException):
+        config.delta_threshold()
+        config.delta_block_size()
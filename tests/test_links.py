@@ -0,0 +1,192 @@
+import os
+import pathlib
+import shutil
+
+import pytest
+
+from sparse_store.config import UnknownSymlinkPolicyFormatException
+
+
+def stored(store, path):
+    return store.config.backup_path() / str(path).lstrip("/")
+
+
+def test_hardlinks_stored_once(tmp_path, make_store):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a").write_text("shared")
+    os.link(source / "a", source / "b")
+    store = make_store({"backup": [str(source)]})
+
+    result = store.backup()
+    assert result.ok
+    assert result.counters["copies"] == 1
+    assert result.counters["links"] == 1
+    assert stored(store, source / "a").samefile(stored(store, source / "b"))
+
+    # Breaking the link in the original must not leak into the other copy
+    (source / "a").unlink()
+    (source / "a").write_text("changed")
+    assert make_store().backup().ok
+    assert stored(store, source / "a").read_text() == "changed"
+    assert stored(store, source / "b").read_text() == "shared"
+
+
+def test_symlinks_preserved(tmp_path, make_store):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "target").write_text("content")
+    (source / "link").symlink_to("target")
+    (source / "dangling").symlink_to("missing")
+    store = make_store({"backup": [str(source)]})
+
+    assert store.backup().ok
+    assert os.readlink(stored(store, source / "link")) == "target"
+    assert os.readlink(stored(store, source / "dangling")) == "missing"
+
+    result = make_store().backup()
+    assert result.counters["copies"] == 0
+
+
+def test_follow_stops_at_loops(tmp_path, make_store):
+    source = tmp_path / "source"
+    (source / "sub").mkdir(parents=True)
+    (source / "sub" / "file").write_text("content")
+    (source / "sub" / "up").symlink_to("..")
+    store = make_store({"backup": [str(source)], "links": {"symlinks": "follow"}})
+
+    assert store.backup().ok
+    assert stored(store, source / "sub" / "file").read_text() == "content"
+    assert not stored(store, source / "sub" / "up").exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs FIFOs")
+def test_special_files_skipped(tmp_path, make_store):
+    source = tmp_path / "source"
+    source.mkdir()
+    os.mkfifo(source / "fifo")
+    store = make_store({"backup": [str(source)]})
+
+    result = store.backup()
+    assert result.ok
+    assert result.counters["specials"] == 1
+    assert not stored(store, source / "fifo").exists()
+
+
+def test_stored_symlinks_are_not_written_through(tmp_path, make_store):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    victim = outside / "victim.txt"
+    victim.write_text("original")
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "x").symlink_to(victim)
+    (source / "d").symlink_to(outside)
+    store = make_store({"backup": [str(source)]})
+    assert store.backup().ok
+
+    (source / "x").unlink()
+    (source / "x").write_text("new content")
+    (source / "d").unlink()
+    (source / "d").mkdir()
+    (source / "d" / "victim.txt").write_text("new content")
+    assert make_store().backup().ok
+
+    assert victim.read_text() == "original"
+    assert stored(store, source / "x").read_text() == "new content"
+    assert not stored(store, source / "d").is_symlink()
+    assert stored(store, source / "d" / "victim.txt").read_text() == "new content"
+
+
+def test_changed_file_type_replaces_stored_copy(tmp_path, make_store):
+    source = tmp_path / "source"
+    (source / "entry").mkdir(parents=True)
+    (source / "entry" / "inner").write_text("inner")
+    store = make_store({"backup": [str(source)]})
+    assert store.backup().ok
+
+    shutil.rmtree(source / "entry")
+    (source / "entry").write_text("now a file")
+    assert make_store().backup().ok
+    assert stored(store, source / "entry").read_text() == "now a file"
+
+
+def test_failed_entries_do_not_stop_the_walk(tmp_path, make_store, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    names = [f"file{i}" for i in range(8)]
+    for name in names:
+        (source / name).write_text(name)
+    store = make_store({"backup": [str(source)]})
+    copy2 = shutil.copy2
+
+    def failing_copy2(src, dst, **kwargs):
+        if pathlib.Path(src).name == "file3":
+            raise PermissionError(src)
+        return copy2(src, dst, **kwargs)
+
+    monkeypatch.setattr(shutil, "copy2", failing_copy2)
+    result = store.backup()
+    assert result.failures == [
+        ("Error on copy", (source / "file3", stored(store, source / "file3")))
+    ]
+    assert result.counters["copies"] == 7
+    for name in names:
+        assert stored(store, source / name).exists() == (name != "file3")
+
+
+def test_symlinks_keep_mtime(tmp_path, make_store):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "link").symlink_to("missing")
+    os.utime(source / "link", ns=(1, 123456789123456789), follow_symlinks=False)
+    store = make_store({"backup": [str(source)]})
+    assert store.backup().ok
+    stored_link = stored(store, source / "link")
+    assert stored_link.lstat().st_mtime_ns == 123456789123456789
+
+    # Without the metadata table, the stored link itself shows it is fresh
+    store.config.metadata_file().unlink()
+    result = make_store().backup()
+    assert result.counters["copies"] == 0
+
+
+def test_hardlinks_across_configured_paths(tmp_path, make_store):
+    etc = tmp_path / "etc"
+    (etc / "one").mkdir(parents=True)
+    (etc / "two").mkdir()
+    (etc / "a").write_text("shared")
+    os.link(etc / "a", etc / "b")
+    os.link(etc / "a", etc / "one" / "c")
+    os.link(etc / "a", etc / "two" / "d")
+    store = make_store({"backup": [{str(etc): ["a", "b", "one", "two"]}]})
+
+    result = store.backup()
+    assert result.ok
+    assert result.counters["copies"] == 1
+    assert result.counters["links"] == 3
+    for name in ("b", "one/c", "two/d"):
+        assert stored(store, etc / "a").samefile(stored(store, etc / name))
+
+
+def test_follow_enters_aliased_directories(tmp_path, make_store):
+    source = tmp_path / "source"
+    (source / "real").mkdir(parents=True)
+    (source / "real" / "f").write_text("content")
+    (source / "alias").symlink_to("real")
+    store = make_store({"backup": [str(source)], "links": {"symlinks": "follow"}})
+
+    assert store.backup().ok
+    assert stored(store, source / "real" / "f").read_text() == "content"
+    assert stored(store, source / "alias" / "f").read_text() == "content"
+
+
+def test_invalid_policy_fails_before_copying(tmp_path, make_store):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "file").write_text("content")
+    store = make_store({"backup": [str(source)], "links": {"symlinks": "preserv"}})
+
+    with pytest.raises(UnknownSymlinkPolicyFormatException):
+        store.backup()
+    assert not stored(store, source / "file").exists()
@@ -0,0 +1,111 @@
+import os
+import shutil
+
+from sparse_store import MetadataTable
+from sparse_store import Profiler
+
+
+def make_source(tmp_path):
+    source = tmp_path / "source"
+    (source / "sub").mkdir(parents=True)
+    (source / "a.txt").write_text("hello")
+    (source / "sub" / "b.txt").write_text("world")
+    os.utime(source / "a.txt", ns=(1, 123456789123456789))
+    return source
+
+
+def test_backup_preserves_mtime_ns(tmp_path, make_store, buffered_io):
+    source = make_source(tmp_path)
+    store = make_store({"backup": [str(source)]}, buffered_io)
+    assert store.backup().failures == []
+
+    stored_file = next(store.config.backup_path().rglob("a.txt"))
+    assert stored_file.stat().st_mtime_ns == 123456789123456789
+    table = MetadataTable(store.config.metadata_file())
+    table.load()
+    assert table.get(source / "a.txt")["mtime_ns"] == 123456789123456789
+    assert "uid" not in table.get(source / "a.txt")
+
+
+def test_freshness_does_not_stat_store(tmp_path, make_store, buffered_io):
+    source = make_source(tmp_path)
+    make_store({"backup": [str(source)]}, buffered_io).backup()
+
+    profiler = Profiler()
+    store = make_store(io=buffered_io, profiler=profiler)
+    assert store.backup().failures == []
+    assert profiler.counters["copies"] == 0
+    assert profiler.counters["skips"] == 2
+    # The top-level directory, its two entries and the file in sub/
+    assert profiler.counters["stats"] == 4
+
+    os.utime(source / "a.txt", ns=(1, 123456789123456788))
+    profiler = Profiler()
+    store = make_store(io=buffered_io, profiler=profiler)
+    store.backup()
+    assert profiler.counters["copies"] == 1
+
+
+def test_owner_capture(tmp_path, make_store, buffered_io):
+    source = make_source(tmp_path)
+    store = make_store(
+        {"backup": [str(source)], "metadata": {"owner": True}}, buffered_io
+    )
+    store.backup()
+
+    assert store.metadata.get(source / "a.txt")["uid"] == os.getuid()
+
+
+def test_forget(tmp_path):
+    table = MetadataTable(tmp_path / "metadata.json")
+    stat = tmp_path.stat()
+    for path in ("/etc", "/etc/hosts", "/etcetera"):
+        table.record(path, stat)
+    table.forget("/etc")
+
+    assert list(table.entries) == ["/etcetera"]
+
+
+def test_lost_stored_copies_are_copied_again(tmp_path, make_store, buffered_io):
+    source = make_source(tmp_path)
+    store = make_store({"backup": [str(source)]}, buffered_io)
+    store.backup()
+    backup_path = store.config.backup_path()
+    (next(backup_path.rglob("b.txt"))).unlink()
+
+    result = make_store(io=buffered_io).backup()
+    assert result.counters["copies"] == 1
+    shutil.rmtree(backup_path)
+    backup_path.mkdir()
+
+    result = make_store(io=buffered_io).backup()
+    assert result.counters["copies"] == 2
+    assert next(backup_path.rglob("a.txt")).read_text() == "hello"
+
+
+def test_lost_stored_file_is_copied_again(tmp_path, make_store, buffered_io):
+    source = tmp_path / "single.txt"
+    source.write_text("hello")
+    store = make_store({"backup": [str(source)]}, buffered_io)
+    store.backup()
+    next(store.config.backup_path().rglob("single.txt")).unlink()
+
+    result = make_store(io=buffered_io).backup()
+    assert result.counters["copies"] == 1
+
+
+def test_chmod_refreshes_metadata_without_copying(tmp_path, make_store, buffered_io):
+    source = make_source(tmp_path)
+    os.chmod(source / "a.txt", 0o644)
+    make_store(
+        {"backup": [str(source)], "metadata": {"owner": True}}, buffered_io
+    ).backup()
+
+    os.chmod(source / "a.txt", 0o600)
+    store = make_store(io=buffered_io)
+    result = store.backup()
+    assert result.counters["copies"] == 0
+    stored_file = next(store.config.backup_path().rglob("a.txt"))
+    assert stored_file.stat().st_mode & 0o777 == 0o600
+    assert store.metadata.get(source / "a.txt")["mode"] & 0o777 == 0o600
+    assert stored_file.stat().st_mtime_ns == 123456789123456789
@@ -0,0 +1,91 @@
+import pathlib
+import shutil
+import time
+
+import pytest
+
+from sparse_store import Daemon
+from sparse_store import Profiler
+from sparse_store import PrometheusTextfileHook
+from sparse_store.profiling import build_profiler
+from sparse_store.profiling import ProfileHook
+
+
+def test_nested_stages_are_exclusive():
+    profiler = Profiler()
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            time.sleep(0.01)
+
+    assert profiler.timings["inner"] >= 0.01
+    assert profiler.timings["outer"] < profiler.timings["inner"]
+
+
+def test_prometheus_textfile_hook(tmp_path):
+    textfile = tmp_path / "sparse_store.prom"
+    profiler = Profiler(hooks=[PrometheusTextfileHook(textfile)])
+    with profiler.stage("copy"):
+        profiler.count("copies", 3)
+    profiler.finish()
+
+    text = textfile.read_text()
+    assert 'sparse_store_stage_seconds{stage="copy"}' in text
+    assert "sparse_store_copies 3" in text
+
+
+def test_backup_counters(tmp_path, make_store, buffered_io):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("hello")
+    (source / "b.txt").write_text("world!")
+
+    profiler = Profiler()
+    store = make_store({"backup": [str(source)]}, buffered_io, profiler=profiler)
+    assert store.backup().failures == []
+    assert profiler.counters["copies"] == 2
+    assert profiler.counters["bytes"] == 11
+    assert set(profiler.timings) >= {"load", "plan", "compare", "copy"}
+
+    profiler = Profiler()
+    store = make_store(io=buffered_io, profiler=profiler)
+    assert store.backup().failures == []
+    assert profiler.counters["copies"] == 0
+    assert profiler.counters["skips"] == 2
+
+
+def test_profile_hook_is_abstract():
+    with pytest.raises(TypeError):
+        ProfileHook()
+
+
+def test_daemon_profiles_each_run(tmp_path, make_store):
+    source = tmp_path / "source.txt"
+    source.write_text("hello")
+    textfile = tmp_path / "sparse_store.prom"
+    daemon = Daemon(
+        make_store({"backup": [str(source)]}),
+        profiler_factory=lambda: build_profiler(str(textfile)),
+    )
+
+    daemon.run_once()
+    assert "sparse_store_copies 1" in textfile.read_text()
+    daemon.run_once()
+    assert "sparse_store_copies 0" in textfile.read_text()
+
+
+def test_failed_copies_not_counted(tmp_path, make_store, monkeypatch):
+    for name in ("a", "b"):
+        (tmp_path / name).write_text(name)
+    store = make_store({"backup": [str(tmp_path / "a"), str(tmp_path / "b")]})
+    copy2 = shutil.copy2
+
+    def failing_copy2(src, dst, **kwargs):
+        if pathlib.Path(src).name == "b":
+            raise PermissionError(src)
+        return copy2(src, dst, **kwargs)
+
+    monkeypatch.setattr(shutil, "copy2", failing_copy2)
+    result = store.backup()
+    assert len(result.failures) == 1
+    assert result.counters["copies"] == 1
+    assert result.counters["bytes"] == 1
@@ -1,2 +1,23 @@
 def test_store_config_file(store):
     assert store.config_file().name == "sparse_store.yaml"
+
+
+def test_store_backup_as_library(tmp_path, make_store):
+    source = tmp_path / "source.txt"
+    source.write_text("hello")
+    store = make_store({"backup": [str(source)]})
+
+    result = store.backup()
+    assert result.ok
+    assert result.counters["copies"] == 1
+
+    result = store.backup()
+    assert result.counters == {
+        "stats": 1,
+        "copies": 0,
+        "bytes": 0,
+        "skips": 1,
+        "links": 0,
+        "specials": 0,
+    }
+    assert result.timings["plan"] == 0.0